@@ -0,0 +1,136 @@
+"""
+Admission control for the model-backed routes.
+
+Each request first takes a token from its user's bucket (429 when empty), then
+waits for one of AI_CONCURRENCY inference slots in a bounded queue. A full queue
+or a wait longer than AI_MAX_WAIT_SECONDS is shed immediately with a 503, so
+overload turns into fast rejections with Retry-After instead of slow requests
+for everyone. Limits are per worker process.
+"""
+from contextlib import asynccontextmanager
+from typing import Dict
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "2"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "16"))
+AI_MAX_WAIT_SECONDS = float(os.getenv("AI_MAX_WAIT_SECONDS", "5"))
+AI_RATE_PER_MINUTE = float(os.getenv("AI_RATE_PER_MINUTE", "60"))
+AI_BURST = int(os.getenv("AI_BURST", "10"))
+MAX_TRACKED_USERS = 10000
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float(AI_MAX_WAIT_SECONDS)
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class AdmissionController:
+    def __init__(self, concurrency: int = AI_CONCURRENCY, max_queue: int = AI_MAX_QUEUE,
+                 max_wait: float = AI_MAX_WAIT_SECONDS, rate_per_minute: float = AI_RATE_PER_MINUTE,
+                 burst: int = AI_BURST):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._slots = asyncio.Semaphore(concurrency)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._waiting = 0
+        self._running = 0
+        self._service_time = 0.5  # EWMA of seconds a slot is held, for Retry-After
+        self.counts = {"admitted": 0, "queued": 0, "rate_limited": 0, "shed_queue_full": 0, "shed_timeout": 0}
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_USERS:
+                # Full buckets carry no state worth keeping
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full()}
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._service_time * (self._waiting + 1) / self.concurrency))
+
+    def _shed(self, reason: str, status_code: int, detail: str, retry_after: int, user_id: int):
+        self.counts[reason] += 1
+        logger.warning(f"AI request shed ({reason}) user={user_id} running={self._running} waiting={self._waiting}")
+        raise AdmissionRejected(status_code, detail, retry_after)
+
+    async def acquire(self, user_id: int):
+        wait = self._bucket(user_id).take()
+        if wait:
+            self._shed("rate_limited", 429, "Too many AI requests, slow down", max(1, math.ceil(wait)), user_id)
+
+        if not self._slots.locked():
+            # Free slot: acquire() completes without suspending
+            await self._slots.acquire()
+        else:
+            if self._waiting >= self.max_queue:
+                self._shed("shed_queue_full", 503, "AI service busy, try again shortly", self._retry_after(), user_id)
+            self.counts["queued"] += 1
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._shed("shed_timeout", 503, "AI service busy, try again shortly", self._retry_after(), user_id)
+            finally:
+                self._waiting -= 1
+        self._running += 1
+        self.counts["admitted"] += 1
+
+    def release(self, held_for: float):
+        self._running -= 1
+        self._service_time = 0.8 * self._service_time + 0.2 * held_for
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int):
+        """Hold an inference slot for the duration of the block"""
+        await self.acquire(user_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "running": self._running,
+            "waiting": self._waiting,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+        }
+
+controller = AdmissionController()
@@ -12,6 +12,9 @@ JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", str(60 * 24 * 7)))  # 7 days default
 
+# Comma-separated emails allowed to use admin-only features (profiling)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -36,6 +39,10 @@ def decode_access_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
+def is_admin(email: Optional[str]) -> bool:
+    """Check whether an account is listed in ADMIN_EMAILS"""
+    return bool(email) and email.lower() in ADMIN_EMAILS
+
 async def verify_google_token(token: str) -> Optional[dict]:
     """
     Verify Google ID token using Google's tokeninfo endpoint.
@@ -0,0 +1,50 @@
+"""
+Compute and store keyphrase tags for entries that have none yet, in batches.
+Run once after deploying stored tags; new and edited entries are tagged as they
+are saved.
+
+Usage: python backfill_tags.py [user_id ...]
+"""
+from database import SessionLocal, engine
+import keyphrases
+import models
+import logging
+import os
+import sys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("TAG_BACKFILL_BATCH_SIZE", "256"))
+
+def backfill(user_ids=None):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    try:
+        if not user_ids:
+            user_ids = [u.id for u in db.query(models.User.id).order_by(models.User.id)]
+
+        for user_id in user_ids:
+            after_id, tagged = 0, 0
+            while True:
+                batch = keyphrases.untagged_entries(db, user_id, after_id, BATCH_SIZE)
+                if not batch:
+                    break
+                tagged += keyphrases.tag_entries(db, batch)
+                db.commit()
+                # Short entries stay untagged, so page by id rather than re-querying from the start
+                after_id = batch[-1].id
+            logger.info(f"User {user_id}: tagged {tagged} entries")
+
+        logger.info("✅ Tag backfill completed successfully!")
+
+    except Exception as e:
+        logger.error(f"❌ Backfill failed: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill([int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,127 @@
+"""
+Benchmark the lean read path (read_path.py + TypeAdapter JSON) against the ORM
+path the list endpoints used before: ORM objects validated with from_attributes,
+dumped to Python and encoded with json.dumps, as FastAPI does for a response_model.
+
+Runs against a throwaway SQLite database and reports CPU time per returned row.
+
+Usage: python bench_read_path.py [entries] [repeats]   (defaults: 2000, 20)
+"""
+import os
+import sys
+import tempfile
+
+_DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_FILE}"
+
+from datetime import date, datetime, timedelta
+from sqlalchemy import desc, insert
+from typing import List
+from database import SessionLocal
+import json
+import random
+import time
+import main
+import models
+import read_path
+
+def seed(db, n: int) -> int:
+    user = models.User(email="bench@example.com", google_id="bench")
+    db.add(user)
+    db.flush()
+    habit_ids = db.execute(insert(models.Habit).returning(models.Habit.id), [
+        {"name": f"Habit {i}", "icon": "✅", "is_active": True, "user_id": user.id} for i in range(5)
+    ]).scalars().all()
+    words = "garden river morning coffee project walk read write plan rest".split()
+    entry_ids = db.execute(insert(models.Entry).returning(models.Entry.id), [
+        {
+            "title": f"Entry {i}",
+            "content": " ".join(random.choices(words, k=150)),
+            "folder": random.choice(["Journal", "Work", "Ideas"]),
+            "mood": "😐",
+            "date": date.today() - timedelta(days=i),
+            "user_id": user.id,
+        }
+        for i in range(n)
+    ]).scalars().all()
+    db.execute(insert(models.entry_habits), [
+        {"entry_id": e, "habit_id": h} for e in entry_ids for h in sorted(random.sample(habit_ids, random.randint(0, 3)))
+    ])
+    db.execute(insert(models.Reminder), [
+        {"text": f"Reminder {i}", "date": (date.today() + timedelta(days=i)).isoformat(), "completed": False, "user_id": user.id}
+        for i in range(n)
+    ])
+    db.execute(insert(models.Task), [
+        {"text": f"Task {i}", "color": "green", "completed": False, "created_at": datetime.utcnow(), "user_id": user.id}
+        for i in range(n)
+    ])
+    db.commit()
+    return user.id
+
+def _orm_response(adapter, objects) -> bytes:
+    value = adapter.validate_python(objects, from_attributes=True)
+    return json.dumps(adapter.dump_python(value, mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def orm_entries(db, user_id: int, limit: int) -> bytes:
+    objects = db.query(models.Entry).filter(
+        models.Entry.user_id == user_id
+    ).order_by(desc(models.Entry.id)).limit(limit).all()
+    return _orm_response(main._entry_list, objects)
+
+def orm_reminders(db, user_id: int) -> bytes:
+    objects = db.query(models.Reminder).filter(models.Reminder.user_id == user_id).order_by(models.Reminder.date).all()
+    return _orm_response(main._reminder_list, objects)
+
+def orm_tasks(db, user_id: int) -> bytes:
+    objects = db.query(models.Task).filter(models.Task.user_id == user_id).order_by(models.Task.created_at).all()
+    return _orm_response(main._task_list, objects)
+
+def lean(adapter, rows: List[dict]) -> bytes:
+    return main._json_list(adapter, rows).body
+
+def measure(fn, repeats: int) -> float:
+    """CPU seconds per call, each call in a fresh session like a request"""
+    total = 0.0
+    for _ in range(repeats):
+        db = SessionLocal()
+        started = time.process_time()
+        fn(db)
+        total += time.process_time() - started
+        db.close()
+    return total / repeats
+
+def run(n: int, repeats: int):
+    db = SessionLocal()
+    user_id = seed(db, n)
+    db.close()
+
+    cases = [
+        ("entries (page of 50)", 50,
+         lambda db: orm_entries(db, user_id, 50),
+         lambda db: lean(main._entry_list, read_path.entry_rows(db, user_id, 0, 50))),
+        (f"entries (all {n})", n,
+         lambda db: orm_entries(db, user_id, n),
+         lambda db: lean(main._entry_list, read_path.entry_rows(db, user_id, 0, n))),
+        ("reminders", n,
+         lambda db: orm_reminders(db, user_id),
+         lambda db: lean(main._reminder_list, read_path.reminder_rows(db, user_id))),
+        ("tasks", n,
+         lambda db: orm_tasks(db, user_id),
+         lambda db: lean(main._task_list, read_path.task_rows(db, user_id))),
+    ]
+
+    print(f"{'endpoint':<22}{'rows':>6}{'orm us/row':>12}{'lean us/row':>13}{'saved':>8}")
+    for name, rows, orm_fn, lean_fn in cases:
+        check = SessionLocal()
+        assert json.loads(orm_fn(check)) == json.loads(lean_fn(check)), f"{name}: responses differ"
+        check.close()
+
+        orm_cpu = measure(orm_fn, repeats) / rows * 1e6
+        lean_cpu = measure(lean_fn, repeats) / rows * 1e6
+        print(f"{name:<22}{rows:>6}{orm_cpu:>12.1f}{lean_cpu:>13.1f}{1 - lean_cpu / orm_cpu:>8.0%}")
+
+if __name__ == "__main__":
+    try:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    finally:
+        os.remove(_DB_FILE)
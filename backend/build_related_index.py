@@ -0,0 +1,41 @@
+"""
+Batch build of stored entry embeddings and the "related entries" kNN graph.
+Run once after deploying, or any time to rebuild the graph from scratch.
+Day-to-day updates happen incrementally when entries are created or edited.
+
+Usage: python build_related_index.py [user_id ...]
+"""
+from database import SessionLocal, engine
+import embeddings
+import models
+import logging
+import sys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def build(user_ids=None):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    try:
+        if not user_ids:
+            user_ids = [u.id for u in db.query(models.User.id).order_by(models.User.id)]
+
+        for user_id in user_ids:
+            encoded = embeddings.index_missing(db, user_id)
+            indexed = embeddings.build_neighbors(db, user_id)
+            db.commit()
+            logger.info(f"User {user_id}: encoded {encoded} new entries, built neighbours for {indexed}")
+
+        logger.info("✅ Related-entries index built successfully!")
+
+    except Exception as e:
+        logger.error(f"❌ Build failed: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    build([int(arg) for arg in sys.argv[1:]])
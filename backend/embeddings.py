@@ -0,0 +1,420 @@
+"""
+Entry embedding storage, the chunk-level search index and the precomputed
+"related entries" kNN graph.
+
+Vectors are L2-normalised at encode time so cosine similarity is a plain dot product.
+Long entries are split into overlapping chunks (the model truncates at ~256 tokens);
+the entry-level vector used by the kNN graph is the normalised mean of its chunks.
+
+Every stored vector is tagged with the model that produced it. Each user's search is
+served by one model (UserIndexState.model); while reindex.py moves them to a new
+one, writes go to both models and search keeps using the old vectors.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sentence_transformers import SentenceTransformer
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from database import SessionLocal
+import models
+import profiling
+import numpy as np
+import hashlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Model for new users and the target of reindex.py
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+RELATED_K = int(os.getenv("RELATED_K", "10"))
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))
+# Rows of the similarity matrix computed at once during a full rebuild
+SIMILARITY_BLOCK = 1024
+
+# Chunking: the model reads at most 256 wordpieces, roughly 180 English words at
+# ~1.4 pieces per word. CHUNK_MAX_WORDS bounds the whole encoded chunk, overlap and
+# (for the first chunk) the title included, so nothing is truncated.
+CHUNK_MIN_WORDS = int(os.getenv("CHUNK_MIN_WORDS", "60"))
+CHUNK_MAX_WORDS = int(os.getenv("CHUNK_MAX_WORDS", "180"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "30"))
+# Entry score from its chunk scores: "max" or "topk" (mean of the best SEARCH_POOL_K)
+SEARCH_POOLING = os.getenv("SEARCH_POOLING", "max")
+SEARCH_POOL_K = int(os.getenv("SEARCH_POOL_K", "3"))
+
+_models: Dict[str, SentenceTransformer] = {}
+
+def get_model(name: str = EMBEDDING_MODEL) -> SentenceTransformer:
+    """Load a model once per process; older models stay loaded while users still search with them"""
+    if name not in _models:
+        logger.info(f"Loading embedding model {name}")
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
+
+# Load AI Model (Small, fast)
+model = get_model(EMBEDDING_MODEL)
+
+def preload_serving_models(db: Session):
+    """Load every model some user's search is still served from (see gunicorn.conf.py)"""
+    for row in db.query(models.UserIndexState.model).distinct():
+        get_model(row.model)
+
+def entry_text(title: str, content: str) -> str:
+    """Combine title + content for better context"""
+    return f"{title} {content}"
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+def chunk_text(title: str, content: str) -> List[str]:
+    """
+    Split an entry into overlapping chunks that fit the model's input window.
+    Chunks end at the first paragraph break after CHUNK_MIN_WORDS, so an edit only
+    changes the chunks around it and the rest keep their hash (and stored vector).
+    Each chunk, with its overlap or title, stays within CHUNK_MAX_WORDS.
+    """
+    # The first window shares the budget with the title, later ones with the overlap
+    first_limit = max(1, CHUNK_MAX_WORDS - len((title or "").split()))
+    rest_limit = max(1, CHUNK_MAX_WORDS - max(CHUNK_OVERLAP_WORDS, 0))
+
+    windows: List[List[str]] = []
+    current: List[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(content or ""):
+        words = paragraph.split()
+        # Paragraphs longer than the window are cut at fixed word offsets
+        while len(current) + len(words) > (rest_limit if windows else first_limit):
+            take = (rest_limit if windows else first_limit) - len(current)
+            windows.append(current + words[:take])
+            current, words = [], words[take:]
+        current += words
+        if len(current) >= CHUNK_MIN_WORDS:
+            windows.append(current)
+            current = []
+    if current or not windows:
+        windows.append(current)
+
+    chunks = []
+    for i, window in enumerate(windows):
+        overlap = windows[i - 1][-CHUNK_OVERLAP_WORDS:] if i > 0 and CHUNK_OVERLAP_WORDS > 0 else []
+        chunks.append(" ".join(overlap + window))
+    chunks[0] = entry_text(title, chunks[0])
+    return chunks
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def encode(texts: Sequence[str], model_name: str = EMBEDDING_MODEL) -> np.ndarray:
+    """Encode texts into normalised float32 vectors in large batches"""
+    encoder = get_model(model_name)
+    if not texts:
+        return np.zeros((0, encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+    with profiling.timed_encode(len(texts), model_name):
+        vectors = encoder.encode(list(texts), batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+def to_blob(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+# --- MODEL VERSIONS ---
+
+def index_state(db: Session, user_id: int) -> models.UserIndexState:
+    """A user's index state, created on first use. Does not commit."""
+    state = db.query(models.UserIndexState).filter(models.UserIndexState.user_id == user_id).first()
+    if not state:
+        # Users with vectors from before versioning keep searching with the model that made them
+        existing = db.query(models.EntryEmbedding.model).filter(
+            models.EntryEmbedding.user_id == user_id
+        ).first()
+        state = models.UserIndexState(user_id=user_id, model=existing.model if existing else EMBEDDING_MODEL, cursor=0, done=0, total=0)
+        db.add(state)
+        db.flush()
+    return state
+
+def write_models(state: models.UserIndexState) -> List[str]:
+    """Models new vectors must be written for: the serving one, plus the re-index target"""
+    return [state.model] + ([state.target_model] if state.target_model else [])
+
+# --- EMBEDDINGS ---
+
+def index_entries(db: Session, entries: Iterable[models.Entry], model_name: str = EMBEDDING_MODEL) -> int:
+    """
+    Chunk entries, encode only chunks whose text is new, and upsert the chunk rows
+    and entry-level vectors for one model. All new chunks across the batch go through
+    one encode call. Does not commit. Returns the number of chunks encoded.
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+    entry_ids = [e.id for e in entries]
+
+    # Vectors we already have, keyed by chunk hash, so unchanged chunks are reused
+    known = {}
+    for row in db.query(models.EntryChunk.text_hash, models.EntryChunk.vector).filter(
+        models.EntryChunk.entry_id.in_(entry_ids),
+        models.EntryChunk.model == model_name
+    ):
+        known[row.text_hash] = from_blob(row.vector)
+
+    chunked = [(e, chunk_text(e.title, e.content)) for e in entries]
+    pending = {}
+    for _, chunks in chunked:
+        for chunk in chunks:
+            h = _hash(chunk)
+            if h not in known:
+                pending.setdefault(h, chunk)
+    if pending:
+        known.update(zip(pending.keys(), encode(list(pending.values()), model_name)))
+
+    db.query(models.EntryChunk).filter(
+        models.EntryChunk.entry_id.in_(entry_ids),
+        models.EntryChunk.model == model_name
+    ).delete(synchronize_session=False)
+    db.query(models.EntryEmbedding).filter(
+        models.EntryEmbedding.entry_id.in_(entry_ids),
+        models.EntryEmbedding.model == model_name
+    ).delete(synchronize_session=False)
+
+    chunk_rows, entry_rows = [], []
+    for e, chunks in chunked:
+        hashes = [_hash(chunk) for chunk in chunks]
+        vectors = np.vstack([known[h] for h in hashes])
+        chunk_rows += [
+            {"entry_id": e.id, "user_id": e.user_id, "model": model_name, "chunk_index": i, "text_hash": h, "vector": to_blob(v)}
+            for i, (h, v) in enumerate(zip(hashes, vectors))
+        ]
+        mean = vectors.mean(axis=0)
+        mean /= np.linalg.norm(mean) or 1.0
+        entry_rows.append({"entry_id": e.id, "user_id": e.user_id, "model": model_name, "vector": to_blob(mean)})
+
+    db.bulk_insert_mappings(models.EntryChunk, chunk_rows)
+    db.bulk_insert_mappings(models.EntryEmbedding, entry_rows)
+    db.flush()
+    return len(pending)
+
+def index_for_user(db: Session, user_id: int, entries: Sequence[models.Entry]):
+    """Index entries for every model the user currently needs. Does not commit."""
+    for model_name in write_models(index_state(db, user_id)):
+        index_entries(db, entries, model_name)
+
+def index_missing(db: Session, user_id: int, model_name: Optional[str] = None, batch_size: int = 512) -> int:
+    """Chunk and encode every entry of a user that has no vectors for the model yet"""
+    model_name = model_name or index_state(db, user_id).model
+    total = 0
+    while True:
+        batch = db.query(models.Entry).outerjoin(
+            models.EntryEmbedding,
+            (models.EntryEmbedding.entry_id == models.Entry.id) & (models.EntryEmbedding.model == model_name)
+        ).filter(
+            models.Entry.user_id == user_id,
+            models.EntryEmbedding.entry_id == None
+        ).order_by(models.Entry.id).limit(batch_size).all()
+        if not batch:
+            return total
+        index_entries(db, batch, model_name)
+        total += len(batch)
+
+def load_vectors(db: Session, user_id: int, model_name: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (entry_ids, matrix) of a user's stored entry vectors (serving model by default)"""
+    model_name = model_name or index_state(db, user_id).model
+    rows = db.query(models.EntryEmbedding.entry_id, models.EntryEmbedding.vector).filter(
+        models.EntryEmbedding.user_id == user_id,
+        models.EntryEmbedding.model == model_name
+    ).order_by(models.EntryEmbedding.entry_id).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    ids = np.array([r.entry_id for r in rows], dtype=np.int64)
+    matrix = np.vstack([from_blob(r.vector) for r in rows])
+    return ids, matrix
+
+def load_chunk_vectors(db: Session, user_id: int, model_name: str, entry_filters: Sequence = ()) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (entry_ids, matrix) with one row per stored chunk of a user for one model.
+    entry_filters are SQL conditions on models.Entry, applied before any vector is loaded.
+    """
+    q = db.query(models.EntryChunk.entry_id, models.EntryChunk.vector)
+    if entry_filters:
+        q = q.join(models.Entry, models.Entry.id == models.EntryChunk.entry_id).filter(*entry_filters)
+    rows = q.filter(
+        models.EntryChunk.user_id == user_id,
+        models.EntryChunk.model == model_name
+    ).order_by(models.EntryChunk.entry_id, models.EntryChunk.chunk_index).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+    ids = np.array([r.entry_id for r in rows], dtype=np.int64)
+    matrix = np.vstack([from_blob(r.vector) for r in rows])
+    return ids, matrix
+
+# --- SEARCH ---
+
+def pool_scores(chunk_entry_ids: np.ndarray, scores: np.ndarray, mode: str = SEARCH_POOLING, k: int = SEARCH_POOL_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggregate chunk scores into one score per entry.
+    chunk_entry_ids must be grouped (all chunks of an entry adjacent).
+    """
+    if len(chunk_entry_ids) == 0:
+        return chunk_entry_ids, scores
+    starts = np.flatnonzero(np.r_[True, chunk_entry_ids[1:] != chunk_entry_ids[:-1]])
+    if mode == "topk":
+        pooled = np.array([
+            np.sort(group)[-k:].mean() for group in np.split(scores, starts[1:])
+        ], dtype=np.float32)
+    else:
+        pooled = np.maximum.reduceat(scores, starts)
+    return chunk_entry_ids[starts], pooled
+
+def search(db: Session, user_id: int, query: str, entry_filters: Sequence = (),
+           top_n: int = 5, threshold: float = 0.2, offset: int = 0) -> List[int]:
+    """
+    Entry ids best matching the query, scored over the chunk index of the user's
+    serving model. Only chunks of entries passing entry_filters are loaded and scored.
+    """
+    model_name = index_state(db, user_id).model
+    if index_missing(db, user_id, model_name):
+        db.commit()
+    chunk_entry_ids, matrix = load_chunk_vectors(db, user_id, model_name, entry_filters)
+    if len(chunk_entry_ids) == 0:
+        return []
+
+    scores = matrix @ encode([query], model_name)[0]
+    entry_ids, pooled = pool_scores(chunk_entry_ids, scores)
+    keep = np.flatnonzero(pooled > threshold)
+    # Ties broken by entry id so pages stay consistent across offsets
+    best = keep[np.lexsort((entry_ids[keep], -pooled[keep]))][offset:offset + top_n]
+    return [int(entry_ids[i]) for i in best]
+
+# --- RELATED ENTRIES (kNN GRAPH) ---
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, part, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(part, order, axis=1)
+
+def _neighbor_rows(user_id: int, ids: np.ndarray, matrix: np.ndarray, rows: np.ndarray, k: int) -> List[dict]:
+    """Neighbour rows for matrix[rows] against the whole matrix, excluding self-matches"""
+    scores = matrix[rows] @ matrix.T
+    scores[np.arange(len(rows)), rows] = -np.inf
+    best = _top_k(scores, min(k, len(ids) - 1))
+    out = []
+    for r, cols in zip(range(len(rows)), best):
+        for rank, c in enumerate(cols):
+            out.append({
+                "entry_id": int(ids[rows[r]]),
+                "neighbor_id": int(ids[c]),
+                "user_id": user_id,
+                "rank": rank,
+                "score": float(scores[r, c]),
+            })
+    return out
+
+def _replace_neighbors(db: Session, user_id: int, ids: np.ndarray, matrix: np.ndarray, rows: np.ndarray, k: int):
+    if len(rows) == 0:
+        return
+    db.query(models.EntryNeighbor).filter(
+        models.EntryNeighbor.entry_id.in_([int(ids[r]) for r in rows])
+    ).delete(synchronize_session=False)
+    new_rows = _neighbor_rows(user_id, ids, matrix, rows, k)
+    if new_rows:
+        db.bulk_insert_mappings(models.EntryNeighbor, new_rows)
+
+def build_neighbors(db: Session, user_id: int, k: int = RELATED_K) -> int:
+    """Rebuild a user's whole kNN graph in one batched pass over stored vectors. Does not commit."""
+    ids, matrix = load_vectors(db, user_id)
+    db.query(models.EntryNeighbor).filter(
+        models.EntryNeighbor.user_id == user_id
+    ).delete(synchronize_session=False)
+    if len(ids) < 2:
+        return 0
+
+    # Score in row blocks so large journals don't materialise an N x N matrix
+    for start in range(0, len(ids), SIMILARITY_BLOCK):
+        rows = np.arange(start, min(start + SIMILARITY_BLOCK, len(ids)))
+        new_rows = _neighbor_rows(user_id, ids, matrix, rows, k)
+        if new_rows:
+            db.bulk_insert_mappings(models.EntryNeighbor, new_rows)
+    return len(ids)
+
+def update_neighbors(db: Session, user_id: int, entry_ids: Sequence[int], k: int = RELATED_K):
+    """
+    Incrementally refresh the graph after entries were created or edited.
+    Recomputes the changed entries' own lists plus every list they now enter or
+    previously appeared in. Does not commit.
+    """
+    ids, matrix = load_vectors(db, user_id)
+    changed = np.flatnonzero(np.isin(ids, list(entry_ids)))
+    if len(changed) == 0:
+        return
+
+    # Lists that currently reference a changed entry may need to drop it
+    referencing = {
+        r.entry_id for r in db.query(models.EntryNeighbor.entry_id).filter(
+            models.EntryNeighbor.neighbor_id.in_([int(ids[c]) for c in changed])
+        )
+    }
+
+    # Lists whose k-th score a changed entry now beats (or that are not yet full)
+    kth = np.full(len(ids), -np.inf, dtype=np.float32)
+    counts = np.zeros(len(ids), dtype=np.int64)
+    position = {int(entry_id): i for i, entry_id in enumerate(ids)}
+    for row in db.query(
+        models.EntryNeighbor.entry_id,
+        func.min(models.EntryNeighbor.score).label("kth"),
+        func.count().label("n")
+    ).filter(
+        models.EntryNeighbor.user_id == user_id
+    ).group_by(models.EntryNeighbor.entry_id):
+        i = position.get(row.entry_id)
+        if i is not None:
+            kth[i], counts[i] = row.kth, row.n
+    kth[counts < min(k, len(ids) - 1)] = -np.inf
+
+    scores = matrix[changed] @ matrix.T
+    entering = (scores > kth).any(axis=0)
+
+    affected = set(changed.tolist()) | set(np.flatnonzero(entering).tolist())
+    affected |= {position[e] for e in referencing if e in position}
+    _replace_neighbors(db, user_id, ids, matrix, np.array(sorted(affected), dtype=np.int64), k)
+
+def remove_entry(db: Session, user_id: int, entry_id: int, k: int = RELATED_K):
+    """Drop an entry's vectors and neighbour rows, then refill lists that lost it. Does not commit."""
+    referencing = [
+        r.entry_id for r in db.query(models.EntryNeighbor.entry_id).filter(
+            models.EntryNeighbor.neighbor_id == entry_id
+        )
+    ]
+    db.query(models.EntryNeighbor).filter(
+        (models.EntryNeighbor.entry_id == entry_id) | (models.EntryNeighbor.neighbor_id == entry_id)
+    ).delete(synchronize_session=False)
+    db.query(models.EntryEmbedding).filter(
+        models.EntryEmbedding.entry_id == entry_id
+    ).delete(synchronize_session=False)
+    db.query(models.EntryChunk).filter(
+        models.EntryChunk.entry_id == entry_id
+    ).delete(synchronize_session=False)
+    if not referencing:
+        return
+
+    ids, matrix = load_vectors(db, user_id)
+    rows = np.flatnonzero(np.isin(ids, referencing))
+    _replace_neighbors(db, user_id, ids, matrix, rows, k)
+
+def reindex_entry(entry_id: int):
+    """Background task: re-encode one entry's changed chunks and update the kNN graph around it"""
+    db = SessionLocal()
+    try:
+        entry = db.query(models.Entry).filter(models.Entry.id == entry_id).first()
+        if not entry:
+            return
+        index_for_user(db, entry.user_id, [entry])
+        update_neighbors(db, entry.user_id, [entry.id])
+        db.commit()
+    except Exception as e:
+        logger.error(f"Indexing entry {entry_id} failed: {str(e)}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
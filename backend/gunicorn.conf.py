@@ -0,0 +1,78 @@
+"""
+Production serving: gunicorn master + uvicorn workers.
+
+The app (and with it the SentenceTransformer model and tokenizer) is imported once
+in the master before workers are forked, so the model weights are shared
+copy-on-write instead of loaded once per worker. Each worker pins torch to its
+share of the cores so workers don't oversubscribe the CPU.
+
+Usage: gunicorn -c gunicorn.conf.py main:app
+"""
+import gc
+import logging
+import multiprocessing
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Per-worker torch intra-op threads; defaults to an even split of the cores
+torch_threads = int(os.getenv("TORCH_THREADS") or max(1, multiprocessing.cpu_count() // workers))
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Must be in the environment before torch is imported by the preloaded app
+os.environ.setdefault("OMP_NUM_THREADS", str(torch_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(torch_threads))
+# Rust tokenizer thread pools don't survive fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+logger = logging.getLogger("gunicorn.error")
+
+def when_ready(server):
+    """Runs in the master after the app is preloaded, before any worker is forked"""
+    import embeddings
+    from database import SessionLocal, engine
+
+    # Also preload models that users are still being served from mid re-index,
+    # otherwise each worker would lazily load its own private copy
+    db = SessionLocal()
+    try:
+        embeddings.preload_serving_models(db)
+    except Exception as e:
+        logger.warning(f"Could not preload serving models: {e}")
+    finally:
+        db.close()
+
+    # create_all at import and the query above left a connection in the pool; closing
+    # the session only checks it back in. Drop the pool so forked workers don't all
+    # inherit (and interleave traffic on) the same database socket.
+    engine.dispose()
+
+    # Move everything allocated so far out of the collector's reach; gc passes in the
+    # workers would otherwise touch (and un-share) every object header
+    gc.collect()
+    gc.freeze()
+
+    import process_stats
+    logger.info(f"Master ready with models {sorted(embeddings._models)}: {process_stats.summary()}")
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed once parallel work has run in this process
+
+def post_worker_init(worker):
+    import process_stats
+    logger.info(f"Worker ready (torch threads={torch_threads}): {process_stats.summary()}")
+
+def worker_exit(server, worker):
+    import process_stats
+    logger.info(f"Worker exiting: {process_stats.summary()}")
@@ -0,0 +1,51 @@
+"""
+Import a journal for an existing user from an /export/json file or a folder of
+Markdown files (one entry per .md file, sub-directories become folders).
+
+Usage: python import_journal.py <user_email> <export.json | markdown_dir>
+"""
+from database import SessionLocal, engine
+import importer
+import models
+import logging
+import os
+import sys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run(email: str, path: str):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    try:
+        user = db.query(models.User).filter(models.User.email == email).first()
+        if not user:
+            logger.error(f"❌ No user with email {email}")
+            sys.exit(1)
+
+        if os.path.isdir(path):
+            result = importer.import_records(db, user.id, importer.iter_markdown_folder(path))
+        else:
+            with open(path, encoding="utf-8") as f:
+                result = importer.import_records(db, user.id, importer.iter_export_json(f))
+
+        logger.info(f"✓ Imported {result.as_dict()}")
+        for error in result.errors:
+            logger.warning(f"  skipped {error}")
+
+        logger.info("Indexing imported entries for search...")
+        importer.index_imported(user.id, result.entry_ids)
+        logger.info("✅ Import completed successfully!")
+
+    except Exception as e:
+        logger.error(f"❌ Import failed: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    run(sys.argv[1], sys.argv[2])
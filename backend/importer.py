@@ -0,0 +1,368 @@
+"""
+Bulk import of journals: the /export/json format and folders of Markdown files.
+
+Input is parsed as a stream (one record at a time), rows are written with batched
+executemany inserts in a single transaction (a file that fails to parse imports
+nothing), and imported entries are indexed for search afterwards in large encode
+batches.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from datetime import date, datetime
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+from database import SessionLocal
+import embeddings
+import keyphrases
+import models
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+INDEX_BATCH_SIZE = int(os.getenv("IMPORT_INDEX_BATCH_SIZE", "256"))
+READ_CHUNK = 64 * 1024
+MAX_REPORTED_ERRORS = 50
+
+# Same limits as EntryCreate, so imported entries stay editable from the app
+MAX_TITLE = 255
+MAX_CONTENT = 20000
+MAX_FOLDER = 50
+
+Progress = Callable[[str, int], None]
+
+def _log_progress(stage: str, done: int):
+    logger.info(f"Import {stage}: {done}")
+
+# --- STREAMING PARSERS ---
+
+class _JSONStream:
+    """Incremental reader for {"key": [item, ...], ...} documents"""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Invalid import file: expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer edge may be a truncated number
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError(f"Invalid import file: bad JSON at offset {self.pos}")
+            self._fill()
+
+    def sections(self) -> Iterator[Tuple[str, object]]:
+        """Yield (top_level_key, item) for every element of every top-level array"""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self._value()
+                        if self._peek() == ",":
+                            self.pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                self._value()  # export_date, user, ...
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+def iter_export_json(stream: TextIO) -> Iterator[Tuple[str, dict]]:
+    """Stream records out of an /export/json document"""
+    return _JSONStream(stream).sections()
+
+def _front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    if not text.startswith("---"):
+        return {}, text
+    end = text.find("\n---", 3)
+    if end == -1:
+        return {}, text
+    meta = {}
+    for line in text[3:end].splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            meta[key.strip().lower()] = value.strip().strip('"\'')
+    return meta, text[end + 4:].lstrip("\n")
+
+def iter_markdown_folder(root: str) -> Iterator[Tuple[str, dict]]:
+    """
+    Yield entry records for every .md file under root, one file at a time.
+    Folder comes from the sub-directory, title from front matter or the first
+    "# " heading, date from front matter or the file's modification time.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        rel = os.path.relpath(dirpath, root)
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(".md"):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path, encoding="utf-8") as f:
+                meta, body = _front_matter(f.read())
+
+            title = meta.get("title")
+            if not title and body.startswith("# "):
+                heading, _, body = body.partition("\n")
+                title = heading[2:].strip()
+            habits = [h.strip() for h in meta.get("habits", "").split(",") if h.strip()]
+
+            yield "entries", {
+                "title": title or os.path.splitext(filename)[0],
+                "content": body.strip(),
+                "folder": meta.get("folder") or (rel.split(os.sep)[0] if rel != "." else "Journal"),
+                "mood": meta.get("mood", "😐"),
+                "date": meta.get("date") or date.fromtimestamp(os.path.getmtime(path)).isoformat(),
+                "completed_habits": [{"name": h} for h in habits],
+            }
+
+# --- BATCHED WRITER ---
+
+class ImportResult:
+    def __init__(self):
+        self.entries = 0
+        self.habits_created = 0
+        self.reminders = 0
+        self.tasks = 0
+        self.skipped = 0
+        self.errors: List[str] = []
+        self.entry_ids: List[int] = []
+
+    def skip(self, reason: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(reason)
+
+    def as_dict(self) -> dict:
+        return {
+            "entries": self.entries,
+            "habits_created": self.habits_created,
+            "reminders": self.reminders,
+            "tasks": self.tasks,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+def _parse_date(value, default: date) -> date:
+    if not value:
+        return default
+    return date.fromisoformat(str(value)[:10])
+
+def _parse_datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class _Importer:
+    def __init__(self, db: Session, user_id: int, progress: Progress):
+        self.db = db
+        self.user_id = user_id
+        self.progress = progress
+        self.result = ImportResult()
+        self.entries: List[Tuple[dict, List[dict]]] = []
+        self.reminders: List[dict] = []
+        self.tasks: List[dict] = []
+
+        # Habit references are resolved by name against one upfront lookup
+        self.habit_ids: Dict[str, int] = {}
+        for h in db.query(models.Habit.id, models.Habit.name, models.Habit.is_active).filter(
+            models.Habit.user_id == user_id
+        ).order_by(models.Habit.is_active, models.Habit.id):
+            self.habit_ids[h.name] = h.id  # active habits sort last and win
+
+    def habit_id(self, ref: dict) -> Optional[int]:
+        name = (ref or {}).get("name")
+        if not name:
+            return None
+        name = str(name)
+        if name not in self.habit_ids:
+            self.habit_ids[name] = self.db.execute(
+                insert(models.Habit).returning(models.Habit.id),
+                {"name": name, "icon": str(ref.get("icon") or "✅"), "is_active": True, "user_id": self.user_id}
+            ).scalar_one()
+            self.result.habits_created += 1
+        return self.habit_ids[name]
+
+    def add(self, section: str, item: dict):
+        if not isinstance(item, dict):
+            self.result.skip(f"{section}: expected an object")
+            return
+        try:
+            if section == "entries":
+                self.add_entry(item)
+            elif section == "habits":
+                self.habit_id(item)
+            elif section == "reminders":
+                self.reminders.append({
+                    "text": str(item["text"]),
+                    "date": str(item["date"]),
+                    "completed": bool(item.get("completed", False)),
+                    "user_id": self.user_id,
+                })
+            elif section == "tasks":
+                self.tasks.append({
+                    "text": str(item["text"])[:500],
+                    "color": item.get("color") or "green",
+                    "completed": bool(item.get("completed", False)),
+                    "created_at": _parse_datetime(item.get("created_at")) or datetime.utcnow(),
+                    "completed_at": _parse_datetime(item.get("completed_at")),
+                    "user_id": self.user_id,
+                })
+        except (KeyError, TypeError, ValueError) as e:
+            self.result.skip(f"{section}: {type(e).__name__}: {e}")
+            return
+
+        if len(self.entries) >= INSERT_BATCH_SIZE:
+            self.flush_entries()
+        if len(self.reminders) + len(self.tasks) >= INSERT_BATCH_SIZE:
+            self.flush_others()
+
+    def add_entry(self, item: dict):
+        title = str(item.get("title") or "")
+        content = str(item.get("content") or "")
+        folder = str(item.get("folder") or "Journal")
+        if len(title) > MAX_TITLE or len(content) > MAX_CONTENT or len(folder) > MAX_FOLDER:
+            raise ValueError(f"entry '{title[:40]}' exceeds the title/content/folder length limits")
+        # Habit refs are resolved at flush time, outside add()'s per-record error handling
+        habit_refs = item.get("completed_habits") or []
+        if not isinstance(habit_refs, list) or not all(
+            isinstance(ref, dict) and isinstance(ref.get("name"), (str, type(None))) for ref in habit_refs
+        ):
+            raise ValueError(f"entry '{title[:40]}': completed_habits must be a list of {{\"name\": ...}} objects")
+        row = {
+            "title": title,
+            "content": content,
+            "folder": folder,
+            "mood": str(item.get("mood") or "😐"),
+            "date": _parse_date(item.get("date"), date.today()),
+            "user_id": self.user_id,
+        }
+        self.entries.append((row, habit_refs))
+
+    def flush_entries(self):
+        if not self.entries:
+            return
+        ids = self.db.execute(
+            insert(models.Entry).returning(models.Entry.id, sort_by_parameter_order=True),
+            [row for row, _ in self.entries]
+        ).scalars().all()
+
+        links = []
+        for entry_id, (_, habit_refs) in zip(ids, self.entries):
+            habit_ids = {self.habit_id(ref) for ref in habit_refs} - {None}
+            links += [{"entry_id": entry_id, "habit_id": h} for h in habit_ids]
+        if links:
+            self.db.execute(insert(models.entry_habits), links)
+
+        self.result.entries += len(ids)
+        self.result.entry_ids += ids
+        self.entries = []
+        self.progress("entries", self.result.entries)
+
+    def flush_others(self):
+        if self.reminders:
+            self.db.execute(insert(models.Reminder), self.reminders)
+            self.result.reminders += len(self.reminders)
+        if self.tasks:
+            self.db.execute(insert(models.Task), self.tasks)
+            self.result.tasks += len(self.tasks)
+        self.reminders, self.tasks = [], []
+
+def import_records(db: Session, user_id: int, records: Iterator[Tuple[str, dict]], progress: Progress = _log_progress) -> ImportResult:
+    """
+    Write streamed (section, item) records for a user in batches. Commits once at the
+    end, so an error part-way through (e.g. a truncated file) leaves nothing behind.
+    """
+    importer = _Importer(db, user_id, progress)
+    try:
+        for section, item in records:
+            importer.add(section, item)
+        importer.flush_entries()
+        importer.flush_others()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return importer.result
+
+# --- SEARCH INDEXING ---
+
+def _update_job(db: Session, job_id: Optional[int], **values):
+    if job_id is not None:
+        db.query(models.ImportJob).filter(models.ImportJob.id == job_id).update(values, synchronize_session=False)
+
+def index_imported(user_id: int, entry_ids: List[int], progress: Progress = _log_progress, job_id: Optional[int] = None):
+    """
+    Chunk, encode and tag imported entries in large batches, then rebuild the kNN graph
+    once. Progress is also recorded on the ImportJob row, if one is given.
+    """
+    db = SessionLocal()
+    try:
+        done = 0
+        for start in range(0, len(entry_ids), INDEX_BATCH_SIZE):
+            batch = db.query(models.Entry).filter(
+                models.Entry.id.in_(entry_ids[start:start + INDEX_BATCH_SIZE])
+            ).all()
+            embeddings.index_for_user(db, user_id, batch)
+            keyphrases.tag_entries(db, batch)
+            done += len(batch)
+            _update_job(db, job_id, indexed=done)
+            db.commit()
+            progress("indexed", done)
+
+        # One batched rebuild is cheaper than thousands of incremental updates
+        embeddings.build_neighbors(db, user_id)
+        _update_job(db, job_id, status="done", completed_at=datetime.utcnow())
+        db.commit()
+        progress("related graph rebuilt", done)
+    except Exception as e:
+        logger.error(f"Indexing imported entries for user {user_id} failed: {str(e)}", exc_info=True)
+        db.rollback()
+        _update_job(db, job_id, status="failed", error=str(e)[:500], completed_at=datetime.utcnow())
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,143 @@
+"""
+Keyphrase tagging (KeyBERT-lite) and persisted entry tags.
+
+Candidates are the most frequent 1- and 2-grams of the text. Tokens come from
+CountVectorizer's default token pattern and English stop list, compiled once at
+import instead of building a vectorizer per call. Ties at the MAX_CANDIDATES
+cut-off are broken by first occurrence, which CountVectorizer does not do, so the
+candidate sets can differ from the old extractor's there. Candidates are
+ranked by cosine similarity to the whole document. Batches encode all documents
+in one call and each distinct candidate phrase once, reusing phrase vectors across
+calls through a bounded, lock-guarded cache (extraction runs in threadpool threads).
+"""
+from collections import Counter, OrderedDict
+from sqlalchemy.orm import Session
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from typing import List, Sequence
+from database import SessionLocal
+import embeddings
+import models
+import hashlib
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOP_N = 3
+MAX_CANDIDATES = 20
+MIN_WORDS = 5
+PHRASE_CACHE_SIZE = int(os.getenv("TAG_PHRASE_CACHE", "10000"))
+
+# CountVectorizer's default token_pattern and stop list
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")
+_STOP_WORDS = frozenset(ENGLISH_STOP_WORDS)
+
+_phrase_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_phrase_cache_lock = threading.Lock()
+
+def candidates(text: str) -> List[str]:
+    """The MAX_CANDIDATES most frequent 1/2-grams after stop-word removal"""
+    tokens = [t for t in _TOKEN.findall(text.lower()) if t not in _STOP_WORDS]
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    # Counter keeps first-seen order among equal counts
+    return [g for g, _ in Counter(grams).most_common(MAX_CANDIDATES)]
+
+def _phrase_vectors(phrases: Sequence[str], model_name: str) -> dict:
+    vectors = {}
+    with _phrase_cache_lock:
+        for p in phrases:
+            vector = _phrase_cache.get((model_name, p))
+            if vector is not None:
+                _phrase_cache.move_to_end((model_name, p))
+                vectors[p] = vector
+
+    # Encode outside the lock; a concurrent call may encode the same phrase, which is harmless
+    missing = [p for p in phrases if p not in vectors]
+    if missing:
+        encoded = embeddings.encode(missing, model_name)
+        with _phrase_cache_lock:
+            for phrase, vector in zip(missing, encoded):
+                _phrase_cache[(model_name, phrase)] = vector
+                vectors[phrase] = vector
+            while len(_phrase_cache) > PHRASE_CACHE_SIZE:
+                _phrase_cache.popitem(last=False)
+    return vectors
+
+def extract_batch(texts: Sequence[str], top_n: int = TOP_N, model_name: str = embeddings.EMBEDDING_MODEL) -> List[List[str]]:
+    """Top keyphrases for many texts, with one encode call for documents and one for new phrases"""
+    per_text = [candidates(t) if t and len(t.split()) >= MIN_WORDS else [] for t in texts]
+    todo = [i for i, c in enumerate(per_text) if c]
+    results: List[List[str]] = [[] for _ in texts]
+    if not todo:
+        return results
+
+    doc_vectors = embeddings.encode([texts[i] for i in todo], model_name)
+    phrase_vectors = _phrase_vectors(list({p for i in todo for p in per_text[i]}), model_name)
+    for i, doc in zip(todo, doc_vectors):
+        scored = sorted(per_text[i], key=lambda p: float(phrase_vectors[p] @ doc), reverse=True)
+        results[i] = scored[:top_n]
+    return results
+
+def extract(text: str, top_n: int = TOP_N) -> List[str]:
+    return extract_batch([text], top_n)[0]
+
+# --- PERSISTED TAGS ---
+
+def _hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def tag_entries(db: Session, entries: Sequence[models.Entry], force: bool = False) -> int:
+    """
+    Compute and store tags for entries whose content changed since they were last
+    tagged, in one batch. Does not commit. Returns the number of entries (re)tagged.
+    """
+    entries = list(entries)
+    if not entries:
+        return 0
+
+    current = {
+        row.entry_id: row.text_hash for row in db.query(models.EntryTag.entry_id, models.EntryTag.text_hash).filter(
+            models.EntryTag.entry_id.in_([e.id for e in entries])
+        )
+    }
+    stale = [e for e in entries if force or current.get(e.id) != _hash(e.content)]
+    if not stale:
+        return 0
+
+    tags = extract_batch([e.content for e in stale])
+    db.query(models.EntryTag).filter(
+        models.EntryTag.entry_id.in_([e.id for e in stale])
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.EntryTag, [
+        {"entry_id": e.id, "user_id": e.user_id, "tag": tag, "rank": rank, "text_hash": _hash(e.content)}
+        for e, entry_tags in zip(stale, tags)
+        for rank, tag in enumerate(entry_tags)
+    ])
+    db.flush()
+    return len(stale)
+
+def untagged_entries(db: Session, user_id: int, after_id: int, limit: int) -> List[models.Entry]:
+    """Entries without any stored tag, in id order (short entries legitimately have none)"""
+    return db.query(models.Entry).outerjoin(
+        models.EntryTag, models.EntryTag.entry_id == models.Entry.id
+    ).filter(
+        models.Entry.user_id == user_id,
+        models.Entry.id > after_id,
+        models.EntryTag.entry_id == None
+    ).order_by(models.Entry.id).limit(limit).all()
+
+def retag_entry(entry_id: int):
+    """Background task: refresh one entry's stored tags if its content changed"""
+    db = SessionLocal()
+    try:
+        entry = db.query(models.Entry).filter(models.Entry.id == entry_id).first()
+        if entry:
+            tag_entries(db, [entry])
+            db.commit()
+    except Exception as e:
+        logger.error(f"Tagging entry {entry_id} failed: {str(e)}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
@@ -1,18 +1,29 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, BackgroundTasks, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, text
+from sqlalchemy import desc, func, select, text
 from datetime import date, datetime, timedelta
 import models
-from database import engine, get_db
-from pydantic import BaseModel, Field
+from database import engine, get_db, SessionLocal
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
 from typing import List, Optional
 import auth
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import CountVectorizer
+import admission
+import process_stats
+import profiling
+import embeddings
+import importer
+import keyphrases
+import read_path
+import pydantic_core
+import asyncio
+import io
+import json
 import logging
+import os
 import time
 
 # Setup Logging
@@ -21,6 +32,7 @@ logger = logging.getLogger(__name__)
 
 # Create Database Tables
 models.Base.metadata.create_all(bind=engine)
+profiling.instrument_engine(engine)
 
 app = FastAPI()
 
@@ -30,13 +42,16 @@ def health_check(db: Session = Depends(get_db)):
     try:
         # Check DB connection
         db.execute(text("SELECT 1"))
-        return {"status": "ok", "database": "connected"}
+        # Memory of whichever worker answered; use it to size WEB_CONCURRENCY
+        return {
+            "status": "ok",
+            "database": "connected",
+            "worker": process_stats.memory_usage(),
+            "admission": admission.controller.stats(),
+        }
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
 
-# Load AI Model (Small, fast)
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
 app.add_middleware(
     CORSMiddleware,
     # Restrict to frontend origin (local + prod)
@@ -59,6 +74,43 @@ async def log_requests(request: Request, call_next):
         logger.error(f"Request failed: {request.url.path} Error: {str(e)} Duration: {process_time:.4f}s", exc_info=True)
         raise e
 
+def _is_admin_request(request: Request) -> bool:
+    """Resolve the bearer token of a raw request and check it belongs to an admin"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    payload = auth.decode_access_token(token) if scheme.lower() == "bearer" and token else None
+    if not payload or payload.get("sub") is None:
+        return False
+    db = SessionLocal()
+    try:
+        user = db.query(models.User.email).filter(models.User.id == payload.get("sub")).first()
+        return bool(user) and auth.is_admin(user.email)
+    finally:
+        db.close()
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """
+    Trace SQL and model-encode timings for every request; run the sampling profiler
+    when an admin sends X-Profile or the request is sampled (slow requests start it
+    late). Profiled and slow requests are saved to the profile ring buffer (see
+    profiling.py).
+    """
+    requested = bool(request.headers.get("x-profile")) and await run_in_threadpool(_is_admin_request, request)
+    trace = profiling.start(request.method, request.url.path, request.scope, requested or profiling.should_sample())
+    try:
+        response = await call_next(request)
+    except Exception:
+        record = profiling.finish(trace, 500)
+        if record:
+            await run_in_threadpool(profiling.save, record)
+        raise
+    # Only the (rare) disk write leaves the event loop
+    record = profiling.finish(trace, response.status_code)
+    name = await run_in_threadpool(profiling.save, record) if record else None
+    if name and requested:
+        response.headers["X-Profile-Id"] = name
+    return response
+
 # --- AUTHENTICATION ---
 security = HTTPBearer()
 
@@ -88,6 +140,26 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     
     return user
 
+async def ai_admission(current_user: models.User = Depends(get_current_user)):
+    """
+    Dependency for model-backed routes: per-user rate limit plus a bounded queue
+    for inference slots. Sheds load with 429/503 and Retry-After.
+    """
+    try:
+        await admission.controller.acquire(current_user.id)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        admission.controller.release(time.monotonic() - started)
+
+def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    if not auth.is_admin(current_user.email):
+        raise HTTPException(status_code=403, detail="Admin only")
+    return current_user
+
 # --- AUTH SCHEMAS ---
 class GoogleAuthSchema(BaseModel):
     credential: str  # Google ID token from frontend
@@ -96,8 +168,7 @@ class UserResponse(BaseModel):
     id: int
     email: str
     created_at: datetime
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TokenResponse(BaseModel):
     token: str
@@ -176,8 +247,7 @@ class HabitSchema(BaseModel):
     name: str
     icon: str
     is_active: bool
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class HabitCreate(BaseModel):
     name: str
@@ -198,8 +268,7 @@ class EntryResponse(BaseModel):
     mood: str
     date: date
     completed_habits: List[HabitSchema] = []
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ReminderCreate(BaseModel):
     text: str
@@ -213,11 +282,20 @@ class ReminderResponse(BaseModel):
     text: str
     date: str
     completed: bool
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SearchSchema(BaseModel):
     query: str
+    # Filters are applied in SQL before any vector is scored
+    folder: Optional[str] = None
+    mood: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    habit_ids: List[int] = []  # entries that completed any of these habits
+    tags: List[str] = []  # entries carrying any of these stored tags
+    top_k: int = Field(default=5, ge=1, le=50)
+    threshold: float = Field(default=0.2, ge=-1, le=1)
+    offset: int = Field(default=0, ge=0)
 
 class AutoTagSchema(BaseModel):
     content: str
@@ -239,8 +317,15 @@ class TaskResponse(BaseModel):
     completed: bool
     created_at: datetime
     completed_at: Optional[datetime] = None
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+# List endpoints validate and serialize plain rows in one pass (see read_path.py)
+_entry_list = TypeAdapter(List[EntryResponse])
+_reminder_list = TypeAdapter(List[ReminderResponse])
+_task_list = TypeAdapter(List[TaskResponse])
+
+def _json_list(adapter: TypeAdapter, rows: List[dict]) -> Response:
+    return Response(content=adapter.dump_json(adapter.validate_python(rows)), media_type="application/json")
 
 # --- ENDPOINTS ---
 
@@ -273,7 +358,7 @@ def delete_habit(habit_id: int, current_user: models.User = Depends(get_current_
 
 # 2. Entries
 @app.post("/entries/", response_model=EntryResponse)
-def create_entry(entry: EntryCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_entry(entry: EntryCreate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     
     # Create basic entry
     db_entry = models.Entry(
@@ -296,17 +381,21 @@ def create_entry(entry: EntryCreate, current_user: models.User = Depends(get_cur
     db.add(db_entry)
     db.commit()
     db.refresh(db_entry)
+    background_tasks.add_task(embeddings.reindex_entry, db_entry.id)
+    background_tasks.add_task(keyphrases.retag_entry, db_entry.id)
     return db_entry
 
 @app.put("/entries/{entry_id}", response_model=EntryResponse)
-def update_entry(entry_id: int, entry: EntryCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_entry(entry_id: int, entry: EntryCreate, background_tasks: BackgroundTasks, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     db_entry = db.query(models.Entry).filter(
         models.Entry.id == entry_id,
         models.Entry.user_id == current_user.id
     ).first()
     if not db_entry:
         raise HTTPException(status_code=404, detail="Entry not found")
-    
+
+    # Only re-encode when the searchable text changed (autosave fires on every pause)
+    text_changed = (db_entry.title, db_entry.content) != (entry.title, entry.content)
     db_entry.title = entry.title
     db_entry.content = entry.content
     db_entry.folder = entry.folder
@@ -318,16 +407,37 @@ def update_entry(entry_id: int, entry: EntryCreate, current_user: models.User =
              models.Habit.user_id == current_user.id
          ).all()
          db_entry.completed_habits = habits
-         
+
     db.commit()
     db.refresh(db_entry)
+    if text_changed:
+        background_tasks.add_task(embeddings.reindex_entry, db_entry.id)
+        background_tasks.add_task(keyphrases.retag_entry, db_entry.id)
     return db_entry
 
 @app.get("/entries/", response_model=List[EntryResponse])
 def read_entries(skip: int = 0, limit: int = 50, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(models.Entry).filter(
+    return _json_list(_entry_list, read_path.entry_rows(db, current_user.id, skip, limit))
+
+@app.get("/entries/{entry_id}/related", response_model=List[EntryResponse])
+def read_related_entries(entry_id: int, limit: int = Query(default=embeddings.RELATED_K, ge=1, le=embeddings.RELATED_K), current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Semantically similar past entries, served from the precomputed kNN graph."""
+    entry = db.query(models.Entry.id).filter(
+        models.Entry.id == entry_id,
         models.Entry.user_id == current_user.id
-    ).order_by(desc(models.Entry.id)).offset(skip).limit(limit).all()
+    ).first()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Entry not found")
+
+    return _json_list(_entry_list, read_path.related_rows(db, current_user.id, entry_id, limit))
+
+@app.get("/entries/{entry_id}/tags", response_model=List[str])
+def read_entry_tags(entry_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Stored tags of an entry, most relevant first."""
+    return [row.tag for row in db.query(models.EntryTag.tag).filter(
+        models.EntryTag.entry_id == entry_id,
+        models.EntryTag.user_id == current_user.id
+    ).order_by(models.EntryTag.rank)]
 
 @app.delete("/entries/{entry_id}", status_code=204)
 def delete_entry(entry_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -337,7 +447,9 @@ def delete_entry(entry_id: int, current_user: models.User = Depends(get_current_
     ).first()
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
-    
+
+    embeddings.remove_entry(db, current_user.id, entry.id)
+    db.query(models.EntryTag).filter(models.EntryTag.entry_id == entry.id).delete(synchronize_session=False)
     db.delete(entry)
     db.commit()
     return None
@@ -345,9 +457,7 @@ def delete_entry(entry_id: int, current_user: models.User = Depends(get_current_
 # 3. Reminders
 @app.get("/reminders/", response_model=List[ReminderResponse])
 def read_reminders(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(models.Reminder).filter(
-        models.Reminder.user_id == current_user.id
-    ).order_by(models.Reminder.date).all()
+    return _json_list(_reminder_list, read_path.reminder_rows(db, current_user.id))
 
 @app.post("/reminders/", response_model=ReminderResponse)
 def create_reminder(reminder: ReminderCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -398,9 +508,7 @@ def read_tasks(current_user: models.User = Depends(get_current_user), db: Sessio
     ).delete(synchronize_session=False)
     db.commit()
 
-    return db.query(models.Task).filter(
-        models.Task.user_id == current_user.id
-    ).order_by(models.Task.created_at).all()
+    return _json_list(_task_list, read_path.task_rows(db, current_user.id))
 
 @app.post("/tasks/", response_model=TaskResponse)
 def create_task(task: TaskCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -450,70 +558,78 @@ def delete_task(task_id: int, current_user: models.User = Depends(get_current_us
     return {"ok": True}
 
 # 4. Semantic Search
-@app.post("/search/", response_model=List[EntryResponse])
+@app.post("/search/", response_model=List[EntryResponse], dependencies=[Depends(ai_admission)])
 def semantic_search(search: SearchSchema, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 1. Get all entries for current user
-    entries = db.query(models.Entry).filter(models.Entry.user_id == current_user.id).all()
-    if not entries:
+    return search_entries(db, current_user.id, search)
+
+def search_entries(db: Session, user_id: int, search: SearchSchema) -> List[models.Entry]:
+    # 1. Narrow the candidate set in SQL
+    filters = []
+    if search.folder is not None:
+        filters.append(models.Entry.folder == search.folder)
+    if search.mood is not None:
+        filters.append(models.Entry.mood == search.mood)
+    if search.date_from is not None:
+        filters.append(models.Entry.date >= search.date_from)
+    if search.date_to is not None:
+        filters.append(models.Entry.date <= search.date_to)
+    if search.habit_ids:
+        filters.append(models.Entry.id.in_(
+            select(models.entry_habits.c.entry_id).where(models.entry_habits.c.habit_id.in_(search.habit_ids))
+        ))
+
+    if search.tags:
+        filters.append(models.Entry.id.in_(
+            select(models.EntryTag.entry_id).where(
+                models.EntryTag.user_id == user_id,
+                models.EntryTag.tag.in_(search.tags)
+            )
+        ))
+
+    # 2. Score the query against the remaining chunks
+    # (entry score = best chunk, so text past the model's input window is searchable)
+    ranked_ids = embeddings.search(
+        db, user_id, search.query, filters,
+        top_n=search.top_k, threshold=search.threshold, offset=search.offset
+    )
+    if not ranked_ids:
         return []
 
-    # 2. Prepare corpus
-    # Combine title + content for better context
-    corpus = [f"{e.title} {e.content}" for e in entries]
-    
-    # 3. Encode
-    corpus_embeddings = model.encode(corpus)
-    query_embedding = model.encode([search.query])
-
-    # 4. Calculate Similarity
-    similarities = cosine_similarity(query_embedding, corpus_embeddings)[0]
-
-    # 5. Rank and Sort
-    # Get top 5 indices
-    top_n = 5
-    # sort indices by score descending
-    related_docs_indices = similarities.argsort()[::-1][:top_n]
-
-    results = []
-    for i in related_docs_indices:
-        if similarities[i] > 0.2: # Threshold for relevance
-            results.append(entries[i])
-            
-    return results
+    # 3. Load the matching entries and keep the ranked order
+    entries = db.query(models.Entry).filter(models.Entry.id.in_(ranked_ids)).all()
+    by_id = {e.id: e for e in entries}
+    return [by_id[i] for i in ranked_ids if i in by_id]
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
+@app.get("/tags/", response_model=List[TagCount])
+def read_tags(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """All stored tags of the user with the number of entries carrying each."""
+    count = func.count(models.EntryTag.entry_id)
+    rows = db.query(models.EntryTag.tag, count).filter(
+        models.EntryTag.user_id == current_user.id
+    ).group_by(models.EntryTag.tag).order_by(desc(count), models.EntryTag.tag).all()
+    return [{"tag": tag, "count": n} for tag, n in rows]
+
+@app.get("/index/status")
+def read_index_status(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Which embedding model serves this user's search, and re-index progress if one is running."""
+    state = embeddings.index_state(db, current_user.id)
+    db.commit()
+    return {
+        "model": state.model,
+        "target_model": state.target_model,
+        "done": state.done if state.target_model else None,
+        "total": state.total if state.target_model else None,
+        "completed_at": state.completed_at,
+    }
 
 # 6. Auto-Tagging (KeyBERT-lite)
-@app.post("/autotag/")
+@app.post("/autotag/", dependencies=[Depends(ai_admission)])
 def auto_tag(data: AutoTagSchema, current_user: models.User = Depends(get_current_user)):
-    text = data.content
-    if not text or len(text.split()) < 5:
-        return {"tags": []}
-
-    # 1. Extract candidates (1-gram and 2-grams)
-    # Stop words are removed by default English list
-    try:
-        vectorizer = CountVectorizer(ngram_range=(1, 2), stop_words='english', max_features=20)
-        X = vectorizer.fit_transform([text])
-        candidates = vectorizer.get_feature_names_out()
-    except ValueError:
-        return {"tags": []} # Text might be too short or only stop words
-
-    # 2. Encode document and candidates
-    doc_embedding = model.encode([text])
-    candidate_embeddings = model.encode(candidates)
-
-    # 3. Calculate similarity
-    distances = cosine_similarity(doc_embedding, candidate_embeddings)
-
-    # 4. Get top 3 keywords
-    keywords = []
-    indices = distances.argsort()[0][-3:] # Top 3
-    for i in indices:
-        keywords.append(candidates[i])
-    
-    # Reverse to get most relevant first
-    keywords.reverse()
-
-    return {"tags": keywords}
+    return {"tags": keyphrases.extract(data.content)}
 
 # 7. Export Data
 @app.get("/export/json")
@@ -522,62 +638,238 @@ def export_json(current_user: models.User = Depends(get_current_user), db: Sessi
     Export all user data as JSON.
     Includes entries, habits, and reminders.
     """
-    # Get all user data
-    entries = db.query(models.Entry).filter(models.Entry.user_id == current_user.id).all()
-    habits = db.query(models.Habit).filter(
-        models.Habit.user_id == current_user.id,
-        models.Habit.is_active == True
-    ).all()
-    reminders = db.query(models.Reminder).filter(models.Reminder.user_id == current_user.id).all()
-    tasks = db.query(models.Task).filter(models.Task.user_id == current_user.id).all()
+    # Oldest first: the importer inserts in file order, so a round trip keeps ids (and the list order) intact
+    entries = read_path.entry_rows(db, current_user.id, newest_first=False)
+    for e in entries:
+        e["completed_habits"] = [{"id": h["id"], "name": h["name"], "icon": h["icon"]} for h in e["completed_habits"]]
 
-    # Format data for export
     export_data = {
         "export_date": datetime.utcnow().isoformat(),
         "user": {
             "id": current_user.id,
             "email": current_user.email
         },
-        "entries": [
-            {
-                "id": e.id,
-                "title": e.title,
-                "content": e.content,
-                "folder": e.folder,
-                "mood": e.mood,
-                "date": e.date.isoformat(),
-                "completed_habits": [{"id": h.id, "name": h.name, "icon": h.icon} for h in e.completed_habits]
-            }
-            for e in entries
-        ],
-        "habits": [
-            {
-                "id": h.id,
-                "name": h.name,
-                "icon": h.icon
-            }
-            for h in habits
-        ],
-        "reminders": [
-            {
-                "id": r.id,
-                "text": r.text,
-                "date": r.date,
-                "completed": r.completed
-            }
-            for r in reminders
-        ],
-        "tasks": [
-            {
-                "id": t.id,
-                "text": t.text,
-                "color": t.color,
-                "completed": t.completed,
-                "created_at": t.created_at.isoformat() if t.created_at else None,
-                "completed_at": t.completed_at.isoformat() if t.completed_at else None
-            }
-            for t in tasks
-        ]
+        "entries": entries,
+        "habits": read_path.habit_rows(db, current_user.id),
+        "reminders": read_path.reminder_rows(db, current_user.id),
+        "tasks": read_path.task_rows(db, current_user.id),
+    }
+
+    # Rows are plain JSON-able values (datetimes as ISO 8601), so skip jsonable_encoder
+    return Response(content=pydantic_core.to_json(export_data), media_type="application/json")
+
+# 8. Import Data
+@app.post("/import/json")
+def import_json(background_tasks: BackgroundTasks, file: UploadFile = File(...), current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Import a journal in the /export/json format.
+    The upload is stream-parsed and written in batches in one transaction (habits are
+    matched by name), so an invalid file imports nothing. Imported entries are indexed
+    for search in the background; poll /import/{import_id} for progress.
+    """
+    stream = io.TextIOWrapper(file.file, encoding="utf-8")
+    try:
+        result = importer.import_records(db, current_user.id, importer.iter_export_json(stream))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        stream.detach()
+
+    response = result.as_dict()
+    if result.entry_ids:
+        job = models.ImportJob(user_id=current_user.id, entries=len(result.entry_ids))
+        db.add(job)
+        db.commit()
+        background_tasks.add_task(importer.index_imported, current_user.id, result.entry_ids, job_id=job.id)
+        response["import_id"] = job.id
+    return response
+
+@app.get("/import/{import_id}")
+def read_import_status(import_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Search-indexing progress of an import."""
+    job = db.query(models.ImportJob).filter(
+        models.ImportJob.id == import_id,
+        models.ImportJob.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return {
+        "status": job.status,
+        "entries": job.entries,
+        "indexed": job.indexed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "completed_at": job.completed_at,
     }
 
-    return export_data
\ No newline at end of file
+# 9. Live Search & Auto-Tagging (WebSocket)
+# One authenticated connection per open editor / command menu. Clients stream
+# {"type": "search", "id": n, "query": ...} or {"type": "autotag", "id": n, "content": ...};
+# each type keeps only its latest input, waits for it to settle, and results for
+# inputs superseded in the meantime are never computed or never sent.
+WS_SETTLE_SECONDS = float(os.getenv("WS_SETTLE_MS", "150")) / 1000
+WS_AUTH_TIMEOUT_SECONDS = 10
+
+class _LatestInput:
+    def __init__(self):
+        self.message = None
+        self.version = 0
+        self.changed = asyncio.Event()
+        self.last_result_key = None
+
+    def push(self, message: dict):
+        self.message = message
+        self.version += 1
+        self.changed.set()
+
+def _ws_search(user_id: int, message: dict):
+    search = SearchSchema.model_validate(message)
+    db = SessionLocal()
+    try:
+        entries = search_entries(db, user_id, search)
+        return [EntryResponse.model_validate(e).model_dump(mode="json") for e in entries]
+    finally:
+        db.close()
+
+def _ws_autotag(user_id: int, message: dict):
+    return keyphrases.extract(str(message.get("content") or ""))
+
+_WS_HANDLERS = {
+    "search": (_ws_search, "results"),
+    "autotag": (_ws_autotag, "tags"),
+}
+
+async def _ws_receive(websocket: WebSocket) -> Optional[dict]:
+    """Next message as a JSON object; None for binary frames, invalid JSON and non-objects"""
+    try:
+        message = json.loads(await websocket.receive_text())
+    except (KeyError, ValueError):  # KeyError: binary frame has no "text"
+        return None
+    return message if isinstance(message, dict) else None
+
+async def _ws_user(websocket: WebSocket) -> Optional[int]:
+    """
+    Authenticate once per connection with a first {"type": "auth", "token": ...} message.
+    Raises WebSocketDisconnect if the client goes away first.
+    """
+    try:
+        message = await asyncio.wait_for(_ws_receive(websocket), timeout=WS_AUTH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return None
+    if message is None or message.get("type") != "auth":
+        return None
+    payload = auth.decode_access_token(str(message.get("token") or ""))
+    if not payload or payload.get("sub") is None:
+        return None
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User.id).filter(models.User.id == payload.get("sub")).first()
+        return user.id if user else None
+    finally:
+        db.close()
+
+async def _ws_worker(websocket: WebSocket, send_lock: asyncio.Lock, user_id: int, kind: str, latest: _LatestInput):
+    handler, output_key = _WS_HANDLERS[kind]
+    while True:
+        await latest.changed.wait()
+
+        # Wait until the input stops changing
+        while True:
+            latest.changed.clear()
+            version = latest.version
+            await asyncio.sleep(WS_SETTLE_SECONDS)
+            if latest.version == version:
+                break
+
+        message = latest.message
+        # Same input as the last answered one (e.g. cursor moves): nothing to recompute
+        result_key = {k: v for k, v in message.items() if k != "id"}
+        if result_key == latest.last_result_key:
+            continue
+
+        try:
+            async with admission.controller.slot(user_id):
+                if latest.version != version:
+                    continue  # superseded while queued for a slot
+                result = await run_in_threadpool(handler, user_id, message)
+        except admission.AdmissionRejected as e:
+            async with send_lock:
+                await websocket.send_json({"type": "error", "id": message.get("id"), "status": e.status_code,
+                                           "detail": e.detail, "retry_after": e.retry_after})
+            continue
+        except ValidationError as e:
+            async with send_lock:
+                await websocket.send_json({"type": "error", "id": message.get("id"), "status": 422, "detail": e.errors(include_url=False)})
+            continue
+        except Exception as e:
+            logger.error(f"AI websocket {kind} failed: {str(e)}", exc_info=True)
+            async with send_lock:
+                await websocket.send_json({"type": "error", "id": message.get("id"), "status": 500, "detail": f"{kind} failed"})
+            continue
+
+        if latest.version != version:
+            continue  # superseded while encoding; a fresher result is on its way
+        latest.last_result_key = result_key
+        async with send_lock:
+            await websocket.send_json({"type": kind, "id": message.get("id"), output_key: result})
+
+@app.websocket("/ws/ai")
+async def ai_websocket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        user_id = await _ws_user(websocket)
+    except WebSocketDisconnect:
+        return
+    if user_id is None:
+        await websocket.close(code=4401, reason="Not authenticated")
+        return
+    await websocket.send_json({"type": "ready"})
+
+    send_lock = asyncio.Lock()
+    inputs = {kind: _LatestInput() for kind in _WS_HANDLERS}
+    workers = [
+        asyncio.create_task(_ws_worker(websocket, send_lock, user_id, kind, latest))
+        for kind, latest in inputs.items()
+    ]
+    try:
+        while True:
+            message = await _ws_receive(websocket)
+            latest = inputs.get(message.get("type")) if message is not None else None
+            if latest is None:
+                async with send_lock:
+                    detail = "Unknown message type" if message is not None else "Expected a JSON object text frame"
+                    await websocket.send_json({"type": "error", "status": 400, "detail": detail})
+                continue
+            latest.push(message)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"AI websocket failed: {str(e)}", exc_info=True)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+# 10. Profiles (admin)
+@app.get("/admin/profiles")
+def list_profiles(admin: models.User = Depends(get_admin_user)):
+    """Captured slow / profiled requests, newest first."""
+    return {"profiles": profiling.list_records()}
+
+@app.get("/admin/profiles/{name}")
+def read_profile(name: str, admin: models.User = Depends(get_admin_user)):
+    """Full record: SQL statements, encode timings and the collapsed-stack profile."""
+    record = profiling.read_record(name)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return record
+
+@app.get("/admin/profiles/{name}/folded", response_class=PlainTextResponse)
+def download_profile_folded(name: str, admin: models.User = Depends(get_admin_user)):
+    """Profile in collapsed-stack format, for flamegraph.pl / speedscope."""
+    record = profiling.read_record(name)
+    if record is None or not record.get("profile_folded"):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    filename = name[:-len(".json")] + ".folded"
+    return PlainTextResponse(record["profile_folded"], headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
@@ -0,0 +1,46 @@
+"""
+Migration script to tag stored embeddings with the model that produced them.
+Run this ONCE after deploying the new code, before reindex.py.
+
+Usage: python migrate_embedding_models.py
+"""
+from sqlalchemy import text
+from database import SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LEGACY_MODEL = "all-MiniLM-L6-v2"
+
+def migrate():
+    db = SessionLocal()
+
+    try:
+        logger.info("Adding model column to entry_embeddings and entry_chunks tables...")
+        db.execute(text(f"ALTER TABLE entry_embeddings ADD COLUMN IF NOT EXISTS model VARCHAR NOT NULL DEFAULT '{LEGACY_MODEL}'"))
+        db.execute(text(f"ALTER TABLE entry_chunks ADD COLUMN IF NOT EXISTS model VARCHAR NOT NULL DEFAULT '{LEGACY_MODEL}'"))
+        db.execute(text("ALTER TABLE entry_embeddings ALTER COLUMN model DROP DEFAULT"))
+        db.execute(text("ALTER TABLE entry_chunks ALTER COLUMN model DROP DEFAULT"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_chunks_model ON entry_chunks(model)"))
+
+        logger.info("Re-keying entry_embeddings on (entry_id, model)...")
+        db.execute(text("ALTER TABLE entry_embeddings DROP CONSTRAINT IF EXISTS entry_embeddings_pkey"))
+        db.execute(text("ALTER TABLE entry_embeddings ADD PRIMARY KEY (entry_id, model)"))
+
+        db.commit()
+        logger.info("✅ Migration completed successfully!")
+        logger.info("")
+        logger.info("Next steps:")
+        logger.info("1. Set EMBEDDING_MODEL in backend/.env to the new model")
+        logger.info("2. Run: python reindex.py")
+
+    except Exception as e:
+        logger.error(f"❌ Migration failed: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,34 @@
+"""
+Migration script to add the indexes used by filtered search.
+New databases get them from create_all; run this ONCE on existing ones.
+
+Usage: python migrate_search_indexes.py
+"""
+from sqlalchemy import text
+from database import SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate():
+    db = SessionLocal()
+
+    try:
+        logger.info("Adding indexes on entries(user_id), entries(folder) and entry_habits(habit_id)...")
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_entries_user_id ON entries(user_id)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_entries_folder ON entries(folder)"))
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_habits_habit_id ON entry_habits(habit_id)"))
+
+        db.commit()
+        logger.info("✅ Migration completed successfully!")
+
+    except Exception as e:
+        logger.error(f"❌ Migration failed: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Date, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Date, DateTime, Float, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import date, datetime
@@ -6,7 +6,7 @@ from datetime import date, datetime
 # Many-to-Many Association Table
 entry_habits = Table('entry_habits', Base.metadata,
     Column('entry_id', Integer, ForeignKey('entries.id')),
-    Column('habit_id', Integer, ForeignKey('habits.id'))
+    Column('habit_id', Integer, ForeignKey('habits.id'), index=True)
 )
 
 class User(Base):
@@ -39,10 +39,10 @@ class Entry(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     content = Column(String)
-    folder = Column(String, default="Journal")
+    folder = Column(String, default="Journal", index=True)
     mood = Column(String, default="😐")
     date = Column(Date, default=date.today, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
 
     completed_habits = relationship("Habit", secondary=entry_habits)
     user = relationship("User", back_populates="entries")
@@ -68,3 +68,60 @@ class Task(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
 
     user = relationship("User", back_populates="tasks")
+
+class EntryEmbedding(Base):
+    __tablename__ = "entry_embeddings"
+    entry_id = Column(Integer, ForeignKey('entries.id', ondelete='CASCADE'), primary_key=True)
+    model = Column(String, primary_key=True)  # embedding model that produced the vector
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    vector = Column(LargeBinary, nullable=False)  # normalised mean of the entry's chunk vectors
+
+class EntryChunk(Base):
+    __tablename__ = "entry_chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(Integer, ForeignKey('entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    model = Column(String, nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    text_hash = Column(String(40), nullable=False)  # sha1 of chunk text, lets edits reuse vectors
+    vector = Column(LargeBinary, nullable=False)  # L2-normalised float32
+
+class EntryNeighbor(Base):
+    __tablename__ = "entry_neighbors"
+    # (entry_id, neighbor_id) PK doubles as the lookup index for /related
+    entry_id = Column(Integer, ForeignKey('entries.id', ondelete='CASCADE'), primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey('entries.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+class EntryTag(Base):
+    __tablename__ = "entry_tags"
+    id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(Integer, ForeignKey('entries.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    tag = Column(String, nullable=False, index=True)
+    rank = Column(Integer, nullable=False)
+    text_hash = Column(String(40), nullable=False)  # sha1 of the content the tags were computed from
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    status = Column(String, nullable=False, default="indexing")  # indexing | done | failed
+    entries = Column(Integer, nullable=False)
+    indexed = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+class UserIndexState(Base):
+    __tablename__ = "user_index_state"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    model = Column(String, nullable=False)  # model whose vectors serve search
+    target_model = Column(String, nullable=True)  # set while a re-index is in progress
+    cursor = Column(Integer, default=0)  # last entry id re-indexed for target_model
+    done = Column(Integer, default=0)
+    total = Column(Integer, default=0)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
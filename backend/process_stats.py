@@ -0,0 +1,41 @@
+"""
+Memory figures for the current worker process, read from /proc (Linux only).
+
+RSS counts every resident page, including model weights shared copy-on-write
+with the gunicorn master and the other workers. PSS splits shared pages evenly
+between the processes using them, so the sum of PSS across workers is what the
+box actually pays; USS (private pages) is what each extra worker would add.
+"""
+from typing import Dict
+import os
+import threading
+
+def _read_kb(path: str, fields) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+def memory_usage() -> dict:
+    """Current process memory in MB: rss, pss, uss (private) and shared"""
+    status = _read_kb("/proc/self/status", {"VmRSS"})
+    rollup = _read_kb("/proc/self/smaps_rollup", {"Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"})
+    mb = lambda kb: round(kb / 1024, 1) if kb is not None else None
+    return {
+        "pid": os.getpid(),
+        "rss_mb": mb(status.get("VmRSS")),
+        "pss_mb": mb(rollup.get("Pss")),
+        "uss_mb": mb(rollup["Private_Clean"] + rollup["Private_Dirty"]) if "Private_Clean" in rollup else None,
+        "shared_mb": mb(rollup["Shared_Clean"] + rollup["Shared_Dirty"]) if "Shared_Clean" in rollup else None,
+        "threads": threading.active_count(),
+    }
+
+def summary() -> str:
+    m = memory_usage()
+    return f"pid={m['pid']} rss={m['rss_mb']}MB pss={m['pss_mb']}MB uss={m['uss_mb']}MB shared={m['shared_mb']}MB"
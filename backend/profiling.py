@@ -0,0 +1,284 @@
+"""
+Opt-in request profiling and slow-request capture.
+
+Every request gets a lightweight trace (SQL statements and model-encode timings,
+collected through a context variable). Requests sent by an admin with the
+X-Profile header, or picked by PROFILE_SAMPLE_RATE, also run a statistical
+profiler that samples the stacks of the threads working for that request. Any
+other request still running after SLOW_PROFILE_FRACTION of SLOW_REQUEST_SECONDS
+gets the profiler started late by a watchdog thread, so slow requests carry at
+least a partial profile (profile_started_ms says from when).
+
+Traces of profiled requests, and of any request slower than SLOW_REQUEST_SECONDS,
+are written to a bounded on-disk ring buffer (PROFILE_DIR, PROFILE_RING_SIZE files).
+The profile is kept in collapsed-stack format ("a;b;c count" lines), which
+flamegraph.pl, speedscope and inferno read directly.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import collections
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+# Start profiling unsampled requests once they've run this share of the slow threshold (0 disables)
+SLOW_PROFILE_FRACTION = float(os.getenv("SLOW_PROFILE_FRACTION", "0.5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "50"))
+MAX_SQL_PER_TRACE = 500
+MAX_STATEMENT_CHARS = 2000
+
+_RECORD_NAME = re.compile(r"^[\w.-]+\.json$")
+
+# --- PER-REQUEST TRACE ---
+
+class RequestTrace:
+    def __init__(self, method: str, path: str, scope: dict):
+        self.method = method
+        self.path = path
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.sql: List[dict] = []
+        self.sql_dropped = 0
+        self.encodes: List[dict] = []
+        self.sampler: Optional["_Sampler"] = None
+        self.profile_requested = False
+        self.profile_started_ms: Optional[float] = None
+        self.closed = False
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("profiling_trace", default=None)
+# Which trace each worker thread last did work for; lets the sampler attribute threadpool threads
+_thread_owner: Dict[int, RequestTrace] = {}
+
+def _active() -> Optional[RequestTrace]:
+    trace = _current.get()
+    if trace is None or trace.closed:
+        return None
+    _thread_owner[threading.get_ident()] = trace
+    return trace
+
+@contextmanager
+def timed_encode(count: int, model_name: str):
+    """Record one model.encode call against the current request"""
+    trace = _active()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.encodes.append({
+                "model": model_name,
+                "texts": count,
+                "ms": round((time.perf_counter() - started) * 1000, 2),
+                "at_ms": round((started - trace.started) * 1000, 2),
+            })
+
+def instrument_engine(engine: Engine):
+    """Record every SQL statement (with timing) issued on behalf of a traced request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        _active()  # claim this thread for the sampler
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["profiling_started"].pop()
+        trace = _active()
+        if trace is None:
+            return
+        if len(trace.sql) >= MAX_SQL_PER_TRACE:
+            trace.sql_dropped += 1
+            return
+        trace.sql.append({
+            "statement": statement[:MAX_STATEMENT_CHARS],
+            "executemany": executemany,
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+            "at_ms": round((started - trace.started) * 1000, 2),
+        })
+
+# --- STATISTICAL PROFILER ---
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of threads working for one request every PROFILE_INTERVAL_SECONDS"""
+
+    def __init__(self, trace: RequestTrace):
+        super().__init__(name="request-profiler", daemon=True)
+        self.trace = trace
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def _belongs(self, thread_id: int, frame) -> bool:
+        owner = _thread_owner.get(thread_id)
+        if owner is self.trace:
+            return True
+        if owner is not None and not owner.closed:
+            return False  # busy with another traced request
+        endpoint = self.trace.scope.get("endpoint")
+        code = getattr(endpoint, "__code__", None)
+        while code is not None and frame is not None:
+            if frame.f_code is code:
+                return True
+            frame = frame.f_back
+        return False
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(PROFILE_INTERVAL_SECONDS):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or not self._belongs(thread_id, frame):
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    def stop(self) -> str:
+        self._stop_event.set()
+        self.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+def _start_sampler(trace: RequestTrace):
+    trace.profile_started_ms = trace.elapsed_ms()
+    trace.sampler = _Sampler(trace)
+    trace.sampler.start()
+
+# --- SLOW-REQUEST WATCHDOG ---
+
+_pending: set = set()  # open traces without a sampler
+_pending_lock = threading.Lock()
+_watchdog: Optional[threading.Thread] = None
+
+def _watch():
+    after = SLOW_REQUEST_SECONDS * SLOW_PROFILE_FRACTION
+    while True:
+        time.sleep(min(0.05, max(after / 2, PROFILE_INTERVAL_SECONDS)))
+        now = time.perf_counter()
+        with _pending_lock:
+            due = [t for t in _pending if now - t.started >= after]
+            for trace in due:
+                _pending.discard(trace)
+                _start_sampler(trace)
+
+def _ensure_watchdog():
+    global _watchdog
+    if _watchdog is None:
+        with _pending_lock:
+            if _watchdog is None:
+                _watchdog = threading.Thread(target=_watch, name="slow-request-watchdog", daemon=True)
+                _watchdog.start()
+
+def start(method: str, path: str, scope: dict, profile: bool) -> RequestTrace:
+    """Begin tracing the current request; profile=True also starts the sampler"""
+    trace = RequestTrace(method, path, scope)
+    _current.set(trace)
+    if profile:
+        trace.profile_requested = True
+        _start_sampler(trace)
+    elif SLOW_PROFILE_FRACTION > 0 and SLOW_REQUEST_SECONDS > 0:
+        _ensure_watchdog()
+        with _pending_lock:
+            _pending.add(trace)
+    return trace
+
+def should_sample() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def finish(trace: RequestTrace, status_code: int) -> Optional[dict]:
+    """
+    Stop tracing. Returns the record to persist with save() if the request was
+    profiled or slow, else None. Cheap enough to call inline for every request.
+    """
+    with _pending_lock:
+        trace.closed = True
+        _pending.discard(trace)
+    duration_ms = trace.elapsed_ms()
+    folded = trace.sampler.stop() if trace.sampler else None
+    # A watchdog-started profile alone is no reason to keep a request that ended up fast
+    if not trace.profile_requested and duration_ms < SLOW_REQUEST_SECONDS * 1000:
+        return None
+
+    record = {
+        "method": trace.method,
+        "path": trace.path,
+        "status": status_code,
+        "started_at": trace.started_at.isoformat(),
+        "duration_ms": duration_ms,
+        "slow": duration_ms >= SLOW_REQUEST_SECONDS * 1000,
+        "sql_count": len(trace.sql) + trace.sql_dropped,
+        "sql_ms": round(sum(q["ms"] for q in trace.sql), 2),
+        "sql": trace.sql,
+        "encode_ms": round(sum(e["ms"] for e in trace.encodes), 2),
+        "encodes": trace.encodes,
+        "profile_samples": trace.sampler.samples if trace.sampler else 0,
+        "profile_interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+        "profile_started_ms": trace.profile_started_ms,
+        "profile_folded": folded,
+    }
+    return record
+
+def save(record: dict) -> Optional[str]:
+    """Write a record from finish() to the ring buffer (file I/O; run off the event loop)"""
+    try:
+        return _write(record)
+    except OSError as e:
+        logger.error(f"Could not write profile record: {str(e)}")
+        return None
+
+# --- RING BUFFER ---
+
+def _write(record: dict) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^\w]+", "_", record["path"]).strip("_") or "root"
+    name = f"{int(time.time() * 1000)}-{os.getpid()}-{record['method']}-{slug[:60]}-{int(record['duration_ms'])}ms.json"
+    tmp = os.path.join(PROFILE_DIR, f".{name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(record, f)
+    os.replace(tmp, os.path.join(PROFILE_DIR, name))
+
+    # Drop the oldest records beyond the ring size
+    for old in list_records()[PROFILE_RING_SIZE:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except OSError:
+            pass
+    return name
+
+def list_records() -> List[str]:
+    """Record names, newest first"""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if _RECORD_NAME.match(n)]
+    except FileNotFoundError:
+        return []
+    return sorted(names, key=lambda n: int(n.split("-", 1)[0]), reverse=True)
+
+def read_record(name: str) -> Optional[dict]:
+    if not _RECORD_NAME.match(name):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
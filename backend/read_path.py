@@ -0,0 +1,96 @@
+"""
+Lean read path for the hot list endpoints.
+
+Queries select only the columns the responses need, with Core select() into plain
+dicts, so no ORM objects are built, tracked in the identity map or lazy-loaded.
+Completed habits come from one join over entry_habits for the whole page instead
+of a relationship load per entry. The routes validate the rows with TypeAdapters
+and serialize them straight to JSON bytes.
+"""
+from collections import defaultdict
+from sqlalchemy import desc, select
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Sequence
+import models
+
+def _rows(db: Session, stmt) -> List[dict]:
+    return [row._asdict() for row in db.execute(stmt)]
+
+def habits_by_entry(db: Session, user_id: int, entry_ids: Optional[Sequence[int]] = None) -> Dict[int, List[dict]]:
+    """Completed habits per entry, for the given entries or every entry of the user"""
+    stmt = select(
+        models.entry_habits.c.entry_id,
+        models.Habit.id,
+        models.Habit.name,
+        models.Habit.icon,
+        models.Habit.is_active,
+    ).join(models.Habit, models.Habit.id == models.entry_habits.c.habit_id)
+    if entry_ids is None:
+        stmt = stmt.join(models.Entry, models.Entry.id == models.entry_habits.c.entry_id).where(
+            models.Entry.user_id == user_id
+        )
+    elif not entry_ids:
+        return {}
+    else:
+        stmt = stmt.where(models.entry_habits.c.entry_id.in_(entry_ids))
+
+    habits = defaultdict(list)
+    for entry_id, habit_id, name, icon, is_active in db.execute(stmt.order_by(models.entry_habits.c.entry_id, models.Habit.id)):
+        habits[entry_id].append({"id": habit_id, "name": name, "icon": icon, "is_active": is_active})
+    return habits
+
+_ENTRY_COLUMNS = (
+    models.Entry.id,
+    models.Entry.title,
+    models.Entry.content,
+    models.Entry.folder,
+    models.Entry.mood,
+    models.Entry.date,
+)
+
+def _with_habits(db: Session, user_id: int, entries: List[dict], entry_ids: Optional[Sequence[int]]) -> List[dict]:
+    habits = habits_by_entry(db, user_id, entry_ids)
+    for e in entries:
+        e["completed_habits"] = habits.get(e["id"], [])
+    return entries
+
+def entry_rows(db: Session, user_id: int, skip: Optional[int] = None, limit: Optional[int] = None,
+               newest_first: bool = True) -> List[dict]:
+    """Entries in id order (newest first by default), each with its completed_habits"""
+    stmt = select(*_ENTRY_COLUMNS).where(models.Entry.user_id == user_id).order_by(
+        desc(models.Entry.id) if newest_first else models.Entry.id
+    ).offset(skip).limit(limit)
+    entries = _rows(db, stmt)
+
+    # A page is bounded, so filter by id; a full export joins on the user instead
+    paged = skip is not None or limit is not None
+    return _with_habits(db, user_id, entries, [e["id"] for e in entries] if paged else None)
+
+def related_rows(db: Session, user_id: int, entry_id: int, limit: int) -> List[dict]:
+    """An entry's kNN neighbours by rank, each with its completed_habits"""
+    entries = _rows(db, select(*_ENTRY_COLUMNS).join(
+        models.EntryNeighbor, models.EntryNeighbor.neighbor_id == models.Entry.id
+    ).where(
+        models.EntryNeighbor.entry_id == entry_id
+    ).order_by(models.EntryNeighbor.rank).limit(limit))
+    return _with_habits(db, user_id, entries, [e["id"] for e in entries])
+
+def habit_rows(db: Session, user_id: int) -> List[dict]:
+    return _rows(db, select(
+        models.Habit.id, models.Habit.name, models.Habit.icon
+    ).where(models.Habit.user_id == user_id, models.Habit.is_active == True).order_by(models.Habit.id))
+
+def reminder_rows(db: Session, user_id: int) -> List[dict]:
+    return _rows(db, select(
+        models.Reminder.id, models.Reminder.text, models.Reminder.date, models.Reminder.completed
+    ).where(models.Reminder.user_id == user_id).order_by(models.Reminder.date))
+
+def task_rows(db: Session, user_id: int) -> List[dict]:
+    return _rows(db, select(
+        models.Task.id,
+        models.Task.text,
+        models.Task.color,
+        models.Task.completed,
+        models.Task.created_at,
+        models.Task.completed_at,
+    ).where(models.Task.user_id == user_id).order_by(models.Task.created_at))
@@ -0,0 +1,104 @@
+"""
+Background re-index of every user's entries onto a new embedding model.
+
+Walks each user's entries in id order, in small batches, persisting a cursor after
+every batch so the job can be stopped and resumed. Between batches it sleeps in
+proportion to the time spent encoding (REINDEX_DUTY_CYCLE) so live requests keep
+most of the CPU. A user's search switches to the new vectors only once all of
+their entries are done; until then it is served from the old model.
+
+Usage: python reindex.py [target_model]   (defaults to EMBEDDING_MODEL)
+"""
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+import embeddings
+import models
+import logging
+import os
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "32"))
+# Fraction of wall time the job may spend encoding (0.25 = sleep 3x as long as each batch took)
+DUTY_CYCLE = float(os.getenv("REINDEX_DUTY_CYCLE", "0.25"))
+
+def _throttle(elapsed: float):
+    if 0 < DUTY_CYCLE < 1:
+        time.sleep(elapsed * (1 - DUTY_CYCLE) / DUTY_CYCLE)
+
+def reindex_user(db: Session, user_id: int, target: str):
+    state = embeddings.index_state(db, user_id)
+    if state.model == target:
+        return
+    if state.target_model != target:
+        # New (or changed) target: start the walk from the beginning
+        state.target_model = target
+        state.cursor = 0
+        state.done = 0
+        state.started_at = datetime.utcnow()
+        state.completed_at = None
+    state.total = db.query(models.Entry).filter(models.Entry.user_id == user_id).count()
+    db.commit()
+
+    while True:
+        batch = db.query(models.Entry).filter(
+            models.Entry.user_id == user_id,
+            models.Entry.id > state.cursor
+        ).order_by(models.Entry.id).limit(BATCH_SIZE).all()
+        if not batch:
+            break
+
+        started = time.monotonic()
+        embeddings.index_entries(db, batch, target)
+        state.cursor = batch[-1].id
+        state.done += len(batch)
+        db.commit()
+        logger.info(f"User {user_id}: {state.done}/{state.total} entries re-indexed for {target}")
+        _throttle(time.monotonic() - started)
+
+    # Catch entries whose dual-write failed during the walk, then switch search over,
+    # rebuild the graph from the new vectors and drop the old ones
+    embeddings.index_missing(db, user_id, target)
+    old = state.model
+    state.model = target
+    state.target_model = None
+    state.completed_at = datetime.utcnow()
+    embeddings.build_neighbors(db, user_id)
+    db.query(models.EntryChunk).filter(
+        models.EntryChunk.user_id == user_id,
+        models.EntryChunk.model != target
+    ).delete(synchronize_session=False)
+    db.query(models.EntryEmbedding).filter(
+        models.EntryEmbedding.user_id == user_id,
+        models.EntryEmbedding.model != target
+    ).delete(synchronize_session=False)
+    db.commit()
+    logger.info(f"User {user_id}: switched search from {old} to {target}")
+
+def reindex_all(target: str = embeddings.EMBEDDING_MODEL):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    try:
+        user_ids = [u.id for u in db.query(models.User.id).order_by(models.User.id)]
+        for n, user_id in enumerate(user_ids, 1):
+            reindex_user(db, user_id, target)
+            logger.info(f"Progress: {n}/{len(user_ids)} users on {target}")
+        logger.info("✅ Re-index completed successfully!")
+
+    except Exception as e:
+        logger.error(f"❌ Re-index failed (safe to re-run, it resumes): {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Lower our CPU priority so request handling wins contention
+    if hasattr(os, "nice"):
+        os.nice(10)
+    reindex_all(sys.argv[1] if len(sys.argv) > 1 else embeddings.EMBEDDING_MODEL)
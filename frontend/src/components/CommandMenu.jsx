@@ -1,5 +1,5 @@
 
-import React, { useEffect, useState } from 'react'
+import React, { useEffect, useRef, useState } from 'react'
 import { Command } from 'cmdk'
 import { Search, Calendar, Moon, Sun, BookOpen, BarChart2, Brain } from 'lucide-react'
 
@@ -8,6 +8,9 @@ export function CommandMenu({ view, setView, theme, setTheme }) {
     const [searchQuery, setSearchQuery] = useState('')
     const [searchResults, setSearchResults] = useState([])
     const API_URL = import.meta.env.VITE_API_URL || `http://${window.location.hostname}:8000`;
+    const socketRef = useRef(null)
+    const queryRef = useRef('')
+    const queryIdRef = useRef(0)
 
     useEffect(() => {
         const down = (e) => {
@@ -21,35 +24,47 @@ export function CommandMenu({ view, setView, theme, setTheme }) {
         return () => document.removeEventListener('keydown', down)
     }, [])
 
-    // Debounced Search
+    // Live search socket: authenticated once while the menu is open.
+    // The server waits for typing to settle and drops superseded queries.
+    const sendQuery = () => {
+        queryIdRef.current += 1;
+        socketRef.current.send(JSON.stringify({ type: 'search', id: queryIdRef.current, query: queryRef.current }));
+    };
+
     useEffect(() => {
-        const delayDebounceFn = setTimeout(async () => {
-            if (searchQuery.length > 2) {
-                try {
-                    const token = localStorage.getItem('token');
-                    // Assuming axios is globally available or imported, strictly speaking we should import it.
-                    // For now using fetch for simplicity in this component
-                    const response = await fetch(`${API_URL}/search/`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                            'x-token': token
-                        },
-                        body: JSON.stringify({ query: searchQuery })
-                    });
-                    if (response.ok) {
-                        const data = await response.json();
-                        setSearchResults(data);
-                    }
-                } catch (error) {
-                    console.error("Search failed", error);
-                }
-            } else {
-                setSearchResults([]);
+        if (!open) return;
+
+        const url = new URL(`${API_URL}/ws/ai`, window.location.href);
+        url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(url);
+        socket.onopen = () => socket.send(JSON.stringify({ type: 'auth', token: localStorage.getItem('token') }));
+        socket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'ready') {
+                socketRef.current = socket;
+                if (queryRef.current.length > 2) sendQuery(); // typed before the socket was ready
+            } else if (message.type === 'search' && message.id === queryIdRef.current) {
+                setSearchResults(message.results);
+            } else if (message.type === 'error') {
+                console.error("Search failed", message.detail);
             }
-        }, 300);
+        };
+        socket.onclose = () => { if (socketRef.current === socket) socketRef.current = null };
+
+        return () => {
+            socketRef.current = null;
+            socket.close();
+        };
+    }, [open]);
 
-        return () => clearTimeout(delayDebounceFn);
+    useEffect(() => {
+        queryRef.current = searchQuery;
+        if (searchQuery.length > 2) {
+            if (socketRef.current) sendQuery();
+        } else {
+            queryIdRef.current += 1;
+            setSearchResults([]);
+        }
     }, [searchQuery]);
 
     const runCommand = (command) => {